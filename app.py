@@ -1,41 +1,73 @@
+import asyncio
+import hashlib
 import threading
+from concurrent.futures import ThreadPoolExecutor
 import signal
 import os
 import re
-import json
+import httpx
 import streamlit as st
+from pydantic import ValidationError
 from datetime import datetime
 from src.models import PaperAnalysis
-from src.utils import extract_paper_sections
 from src.credentials import GROQ_API_KEY
 
 # ==========================================
 # 0. THE MONKEY PATCH (Fixes Threading Crash)
 # ==========================================
-# Store the original signal function
-_original_signal = signal.signal
-
-
-# Define a safe version that ignores errors if we aren't in the main thread
-def _safe_signal_handler(signalnum, handler):
-    try:
+# Streamlit re-executes this script on every rerun; patch only once so the
+# wrappers don't stack up (each rerun used to wrap the previous wrapper)
+if not getattr(signal, "_nra_patched", False):
+    # Store the original signal function and the main thread's id
+    _original_signal = signal.signal
+    _MAIN_THREAD_ID = threading.main_thread().ident
+
+    # Define a safe version that ignores errors if we aren't in the main thread
+    def _safe_signal_handler(signalnum, handler):
         # Only try to register signals if we are in the main thread
-        if threading.current_thread() is threading.main_thread():
-            return _original_signal(signalnum, handler)
-    except ValueError:
-        # If we get "signal only works in main thread", just swallow the error
-        pass
-
+        # (the calling thread varies, so this can't be cached as a bool)
+        try:
+            if threading.get_ident() == _MAIN_THREAD_ID:
+                return _original_signal(signalnum, handler)
+        except ValueError:
+            # If we get "signal only works in main thread", just swallow the error
+            pass
 
-# Apply the patch
-signal.signal = _safe_signal_handler
+    # Apply the patch
+    signal.signal = _safe_signal_handler
+    signal._nra_patched = True
 
 # Also try to disable telemetry via Env Var as a backup
 os.environ["CREWAI_TELEMETRY_OPT_OUT"] = "true"
 
 from src.utils import process_zip_file, generate_docx_report
-from src.crew import create_nutrition_crew
-from src.models import PaperAnalysis  # Import the model for validation
+from src.crew import (
+    build_crew,
+    build_compact_crew,
+    build_crew_inputs,
+    has_body_sections,
+    is_short_paper,
+)
+from src import cache
+from src.models import (
+    PaperAnalysis,
+    PAPER_ANALYSIS_ADAPTER,
+    PAPER_ANALYSIS_LIST_ADAPTER,
+)
+
+# Ollama model tags offered in the sidebar (first one is the default)
+OLLAMA_MODELS = {
+    "qwen3:8b-q4_K_M": "Qwen3 8B (int4, q4_K_M)",
+    "qwen3:8b-q8_0": "Qwen3 8B (int8, q8_0)",
+    "qwen3:8b-fp16": "Qwen3 8B (fp16)",
+}
+
+# Default number of papers analyzed concurrently (each one is a full crew run).
+# Kept within the sidebar input's 1-16 range, which rejects anything outside it.
+try:
+    MAX_WORKERS = max(1, min(16, int(os.environ.get("MAX_WORKERS", 4))))
+except ValueError:
+    MAX_WORKERS = 4
 
 
 # ==========================================
@@ -53,7 +85,12 @@ with st.sidebar:
     )
 
     if model_provider == "ollama":
-        model_name = st.text_input("Model Name", value="qwen3")
+        # Quantized tags: int4 roughly doubles tokens/s over fp16 on CPU / mid-range GPUs
+        model_name = st.selectbox(
+            "Model",
+            options=OLLAMA_MODELS,
+            format_func=lambda x: OLLAMA_MODELS[x],
+        )
         base_url = st.text_input("Base URL", value="http://localhost:11434")
         api_key = None
         st.info("Ensure Ollama is running locally.")
@@ -70,6 +107,14 @@ with st.sidebar:
             type="password",
         )
 
+    max_workers = st.number_input(
+        "Parallel Papers",
+        min_value=1,
+        max_value=16,
+        value=MAX_WORKERS,
+        help="How many papers are sent to the model at the same time.",
+    )
+
     model_config = {
         "provider": model_provider,
         "name": model_name,
@@ -77,10 +122,196 @@ with st.sidebar:
         "api_key": api_key,
     }
 
+
+@st.cache_resource(show_spinner="Loading model into Ollama...")
+def _warmup_ollama(model: str, url: str) -> None:
+    """
+    Asks Ollama to load the model (an empty prompt only loads it) and keep it
+    resident, so the first paper doesn't pay the weight-loading stall.
+    Runs once per model/URL across reruns. Raises httpx.HTTPError if Ollama is
+    unreachable; exceptions aren't cached, so the next rerun tries again.
+    """
+    httpx.post(
+        f"{url.rstrip('/')}/api/generate",
+        json={"model": model, "prompt": "", "keep_alive": "30m"},
+        timeout=httpx.Timeout(60.0, connect=2.0),
+    ).raise_for_status()
+
+
+if model_provider == "ollama":
+    try:
+        _warmup_ollama(model_name, base_url)
+    except httpx.HTTPError:
+        pass  # Not fatal: the first paper just loads the model itself
+
 # ==========================================
 # 2. MAIN UI LOGIC
 # ==========================================
 
+
+async def analyze_papers(papers, crew, compact_crew, max_workers, model_id, cache_io):
+    """
+    Runs a copy of `crew` per paper (`compact_crew` for short papers), with at
+    most `max_workers` copies in flight.
+    Papers already in the analysis cache (for model_id) skip the crew entirely;
+    lookups run on the `cache_io` executor so they don't hold crew threads.
+    Yields (paper, output) in completion order; output is the crew output, a
+    cached PaperAnalysis, or the exception the run raised.
+    """
+    sem = asyncio.Semaphore(max_workers)
+    loop = asyncio.get_running_loop()
+
+    async def analyze_one(paper):
+        try:
+            cached = await loop.run_in_executor(
+                cache_io, cache.get, paper["sections"], model_id
+            )
+            if cached:
+                return paper, cached
+
+            async with sem:
+                # Same copy-per-input pattern as Crew.kickoff_for_each, but bounded
+                if is_short_paper(paper["sections"]):
+                    paper_crew = compact_crew.copy()
+                else:
+                    paper_crew = crew.copy()
+                # kickoff is blocking; kickoff_async runs it in a worker thread
+                return paper, await paper_crew.kickoff_async(
+                    inputs=build_crew_inputs(paper["sections"])
+                )
+        except Exception as e:
+            return paper, e
+
+    for next_done in asyncio.as_completed([analyze_one(p) for p in papers]):
+        yield await next_done
+
+
+async def to_analysis(paper, crew_output, model_id, cache_io):
+    """
+    Turns one analyze_papers output into a PaperAnalysis (or None on failure,
+    after reporting the problem in the UI). Fresh analyses are cached on the
+    `cache_io` executor (embedding them can take a while, and more so the first
+    time when the model loads), so the event loop keeps streaming other results.
+    """
+    if isinstance(crew_output, BaseException):
+        st.error(f"Error analyzing {paper['filename']}: {crew_output}")
+        return None
+
+    # Title and filename come from extraction, not the model (None if no title
+    # was found, so the report falls back to the filename)
+    source = {"title": paper["sections"]["title"], "filename": paper["filename"]}
+
+    if isinstance(crew_output, PaperAnalysis):
+        # Served from the analysis cache
+        return crew_output.model_copy(update=source)
+
+    # Extract Pydantic model safely
+    if hasattr(crew_output, "pydantic") and crew_output.pydantic:
+        analysis_result = crew_output.pydantic
+    elif hasattr(crew_output, "raw"):
+        try:
+            # Parse + validate the raw JSON in one pass (no json.loads round-trip)
+            analysis_result = PAPER_ANALYSIS_ADAPTER.validate_json(crew_output.raw)
+        except ValidationError:
+            st.warning(
+                f"Structured data extraction failed for {paper['filename']}. Raw output: {crew_output.raw[:100]}..."
+            )
+            return None
+    else:
+        analysis_result = crew_output
+
+    if isinstance(analysis_result, PaperAnalysis):
+        analysis_result = analysis_result.model_copy(update=source)
+        await asyncio.get_running_loop().run_in_executor(
+            cache_io, cache.put, paper["sections"], model_id, analysis_result
+        )
+
+    return analysis_result
+
+
+def render_expander(res):
+    """Renders one paper's analysis as an expander."""
+    # Dynamic color coding for trust score
+    # (trust_score is optional: the model may fail to score a paper)
+    score = res.trust_score
+    score_color = (
+        "red"
+        if score is None
+        else "green" if score >= 8 else "orange" if score >= 5 else "red"
+    )
+    score_label = "N/A" if score is None else f"{score}/10"
+
+    name = res.title or res.filename
+    with st.expander(f"{name} (:{score_color}[Trust Score: {score_label}])"):
+        col1, col2 = st.columns([1, 2])
+
+        with col1:
+            st.metric(label="Evidence Level", value=res.evidence_level)
+            st.metric(label="Trust Score", value=score_label)
+            if res.has_conflict_of_interest:
+                st.error(f"⚠️ Conflict Detected: {res.funding_source}")
+                st.caption(res.coi_notes)
+            else:
+                st.success("No Obvious COI Detected")
+
+        with col2:
+            st.markdown(f"**Type:** {res.paper_type}")
+            st.markdown(f"**Conclusion:** {res.conclusion_summary}")
+
+            st.markdown("---")
+            st.markdown("### 🔬 Methodology Check")
+            st.write(f"**Control Group:** {res.control_group_quality}")
+            st.write(f"**Intervention:** {res.intervention_details}")
+            st.write(f"**Confounders:** {res.confounding_factors}")
+
+            st.markdown("---")
+            st.markdown("### 📈 Statistical Check")
+            st.write(f"**Endpoints:** {res.endpoints}")
+            st.write(f"**Risk Reporting:** {res.risk_type_reported}")
+            st.write(f"**Significance:** {res.statistical_significance}")
+
+            st.markdown("---")
+            st.info(f"**Final Verdict:** {res.final_verdict}")
+
+
+async def stream_results(
+    papers, crew, compact_crew, max_workers, model_id, progress_bar, live
+):
+    """
+    Consumes analyze_papers as results land: updates progress, stores each
+    analysis in session state and renders it into `live` right away.
+    Runs on the script thread, so Streamlit calls are safe here.
+    """
+    # kickoff_async runs each crew on the loop's default executor, which otherwise
+    # caps out at min(32, cpus + 4) threads regardless of max_workers
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=max_workers)
+    )
+
+    completed = 0
+    # Cache reads/writes get their own thread, off the crew threads and the loop
+    with ThreadPoolExecutor(max_workers=1) as cache_io:
+        async for paper, crew_output in analyze_papers(
+            papers, crew, compact_crew, max_workers, model_id, cache_io
+        ):
+            completed += 1
+            progress_bar.progress(completed / len(papers))
+
+            analysis_result = await to_analysis(
+                paper, crew_output, model_id, cache_io
+            )
+            if analysis_result is None:
+                continue
+
+            st.session_state.results.append(analysis_result)
+            with live:
+                try:
+                    render_expander(analysis_result)
+                except Exception as e:
+                    # Already stored; one bad render shouldn't stop the run
+                    st.error(f"Error displaying {paper['filename']}: {e}")
+
+
 st.title("🧬 Nutrition Science Validator")
 st.markdown("""
 **Upload a ZIP file containing PDF scientific papers.** 
@@ -106,43 +337,58 @@ if uploaded_zip and start_analysis:
     # Step 2: Analyze
     progress_bar = st.progress(0)
 
-    for idx, paper in enumerate(papers):
-        st.info(f"Analyzing: {paper['filename']}...")
+    # Scans, read errors and crashed parses leave at most a title; prompting on
+    # that would only produce an invented analysis
+    for paper in papers:
+        if not has_body_sections(paper["sections"]):
+            st.error(f"{paper['filename']}: No readable text found — skipped.")
+    papers = [paper for paper in papers if has_body_sections(paper["sections"])]
 
-        sections = paper["sections"]
-        if sections["methods"] is None:
+    for paper in papers:
+        if paper["sections"]["methods"] is None:
             st.warning(
                 f"{paper['filename']}: Methods section missing — evidence automatically downgraded."
             )
 
-        # Create Crew with dynamic user config
-        crew = create_nutrition_crew(sections, model_config)
-
-        try:
-            crew_output = crew.kickoff()
-
-            # Extract Pydantic model safely
-            if hasattr(crew_output, "pydantic") and crew_output.pydantic:
-                analysis_result = crew_output.pydantic
-            elif hasattr(crew_output, "raw"):
-                st.warning(
-                    f"Structured data extraction failed for {paper['filename']}. Raw output: {crew_output.raw[:100]}..."
-                )
-                continue
-            else:
-                analysis_result = crew_output
-
-            st.session_state.results.append(analysis_result)
-
-        except Exception as e:
-            st.error(f"Error analyzing {paper['filename']}: {e}")
-
-        progress_bar.progress((idx + 1) / len(papers))
+    # The crews (agents, LLM client, task templates) are built once per model config
+    crew = build_crew(**model_config)
+    compact_crew = build_compact_crew(**model_config)
+
+    # Cached analyses are only reused for the model that produced them
+    model_id = f"{model_config['provider']}/{model_config['name']}"
+
+    st.info(f"Analyzing {len(papers)} papers ({max_workers} at a time)...")
+
+    # Papers show up here as soon as each one finishes; the placeholder is
+    # cleared afterwards since the dashboard below renders the full set
+    live_slot = st.empty()
+    asyncio.run(
+        stream_results(
+            papers,
+            crew,
+            compact_crew,
+            max_workers,
+            model_id,
+            progress_bar,
+            live_slot.container(),
+        )
+    )
+    live_slot.empty()
 
 # ==========================================
 # 3. DASHBOARD DISPLAY
 # ==========================================
 
+
+@st.cache_data(show_spinner=False)
+def _build_docx(results_digest: str, _results: list) -> bytes:
+    """
+    Builds the report once per distinct set of results.
+    Streamlit keys the cache on results_digest only (underscore args aren't hashed).
+    """
+    return generate_docx_report(_results).getvalue()
+
+
 if st.session_state.results:
     st.divider()
 
@@ -150,8 +396,11 @@ if st.session_state.results:
     with col1:
         st.subheader("📊 Analysis Report")
     with col2:
-        # Generate the DOCX file in memory
-        docx_file = generate_docx_report(st.session_state.results)
+        # Generate the DOCX file in memory (cached across reruns until results change)
+        results_digest = hashlib.sha256(
+            PAPER_ANALYSIS_LIST_ADAPTER.dump_json(st.session_state.results)
+        ).hexdigest()
+        docx_file = _build_docx(results_digest, st.session_state.results)
 
         # Generate timestamped filename (e.g., nutrition_report_2026-01-07_14-30-05.docx)
         timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
@@ -166,42 +415,7 @@ if st.session_state.results:
     # ------------------------------------
 
     for res in st.session_state.results:
-        # Dynamic color coding for trust score
-        score_color = (
-            "green"
-            if res.trust_score >= 8
-            else "orange"
-            if res.trust_score >= 5
-            else "red"
-        )
-
-        with st.expander(f"{res.title} (Trust Score: {res.trust_score}/10)"):
-            col1, col2 = st.columns([1, 2])
-
-            with col1:
-                st.metric(label="Evidence Level", value=res.evidence_level)
-                st.metric(label="Trust Score", value=f"{res.trust_score}/10")
-                if res.has_conflict_of_interest:
-                    st.error(f"⚠️ Conflict Detected: {res.funding_source}")
-                    st.caption(res.coi_notes)
-                else:
-                    st.success("No Obvious COI Detected")
-
-            with col2:
-                st.markdown(f"**Type:** {res.paper_type}")
-                st.markdown(f"**Conclusion:** {res.conclusion_summary}")
-
-                st.markdown("---")
-                st.markdown("### 🔬 Methodology Check")
-                st.write(f"**Control Group:** {res.control_group_quality}")
-                st.write(f"**Intervention:** {res.intervention_details}")
-                st.write(f"**Confounders:** {res.confounding_factors}")
-
-                st.markdown("---")
-                st.markdown("### 📈 Statistical Check")
-                st.write(f"**Endpoints:** {res.endpoints}")
-                st.write(f"**Risk Reporting:** {res.risk_type_reported}")
-                st.write(f"**Significance:** {res.statistical_significance}")
-
-                st.markdown("---")
-                st.info(f"**Final Verdict:** {res.final_verdict}")
+        try:
+            render_expander(res)
+        except Exception as e:
+            st.error(f"Error displaying {res.title or res.filename}: {e}")
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from typing import Optional
+
+from pydantic import ValidationError
+
+from src.models import PaperAnalysis, PAPER_ANALYSIS_ADAPTER
+
+CACHE_DB = os.environ.get("NRA_CACHE_DB", "cache.db")
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+SIMILARITY_THRESHOLD = 0.95
+
+logger = logging.getLogger(__name__)
+
+
+def _connect() -> sqlite3.Connection:
+    """Opens the cache DB, creating the table on first use."""
+    conn = sqlite3.connect(CACHE_DB)
+    # Rows are scoped to the model that produced them ("provider/name")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS analyses (
+            hash TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            embedding BLOB,
+            pydantic_json TEXT
+        )
+        """
+    )
+    return conn
+
+
+def _hash_sections(sections: dict, model: str) -> str:
+    """Exact-match key: SHA-256 of the model id and the extracted sections."""
+    payload = json.dumps({"model": model, "sections": sections}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+_encoder = None
+_encoder_error: Optional[Exception] = None
+_ENCODER_LOCK = threading.Lock()
+
+
+def _load_encoder():
+    """
+    Loads the sentence-transformers model once per process.
+    Concurrent Streamlit sessions use the cache from their own threads, so
+    loading happens under a lock (otherwise every thread would load its own
+    copy on a cold start). A failed load is remembered rather than retried for
+    every paper.
+    """
+    global _encoder, _encoder_error
+
+    with _ENCODER_LOCK:
+        if _encoder is None and _encoder_error is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+
+                _encoder = SentenceTransformer(EMBEDDING_MODEL)
+            except Exception as e:
+                _encoder_error = e
+        if _encoder_error is not None:
+            raise RuntimeError("Embedding model unavailable") from _encoder_error
+        return _encoder
+
+
+def _embed(sections: dict) -> Optional[bytes]:
+    """
+    Embeds the abstract as a normalized float32 vector (384 dims).
+    Returns None when the paper has no abstract to compare on, or the encoder
+    can't be loaded.
+    """
+    abstract = sections.get("abstract")
+    if not abstract:
+        return None
+
+    try:
+        vector = _load_encoder().encode(abstract, normalize_embeddings=True)
+    except Exception:
+        # No encoder (not installed, offline download, ...): exact-hash hits still work
+        logger.warning("Abstract embedding unavailable", exc_info=True)
+        return None
+    return vector.astype("float32").tobytes()
+
+
+def _load(pydantic_json: str) -> Optional[PaperAnalysis]:
+    """Validates a stored analysis; rows from an older schema count as a miss."""
+    try:
+        return PAPER_ANALYSIS_ADAPTER.validate_json(pydantic_json)
+    except ValidationError:
+        return None
+
+
+def get(sections: dict, model: str) -> Optional[PaperAnalysis]:
+    """
+    Looks up a previous analysis of these sections by `model` ("provider/name").
+    Best-effort: any cache failure (missing sentence-transformers, model download,
+    SQLite errors) is logged and treated as a miss so the paper is still analyzed.
+    """
+    try:
+        return _get(sections, model)
+    except Exception:
+        logger.exception("Analysis cache lookup failed; treating as a miss")
+        return None
+
+
+def put(sections: dict, model: str, analysis: PaperAnalysis) -> None:
+    """Stores an analysis made by `model` (best-effort: failures are only logged)."""
+    try:
+        _put(sections, model, analysis)
+    except Exception:
+        logger.exception("Could not store analysis in the cache")
+
+
+def _get(sections: dict, model: str) -> Optional[PaperAnalysis]:
+    """
+    Looks up a previous analysis for these sections.
+    Tries an exact hash hit first, then the closest abstract embedding above
+    SIMILARITY_THRESHOLD (near-duplicate preprints, re-exported PDFs, etc).
+    """
+    with closing(_connect()) as conn:
+        row = conn.execute(
+            "SELECT pydantic_json FROM analyses WHERE hash = ?",
+            (_hash_sections(sections, model),),
+        ).fetchone()
+        if row:
+            return _load(row[0])
+
+        query = _embed(sections)
+        if query is None:
+            return None
+
+        rows = conn.execute(
+            "SELECT embedding, pydantic_json FROM analyses"
+            " WHERE model = ? AND embedding IS NOT NULL",
+            (model,),
+        ).fetchall()
+
+    if not rows:
+        return None
+
+    import numpy as np
+
+    # Embeddings are normalized, so the dot product is the cosine similarity
+    matrix = np.frombuffer(b"".join(r[0] for r in rows), dtype=np.float32)
+    scores = matrix.reshape(len(rows), -1) @ np.frombuffer(query, dtype=np.float32)
+    best = int(np.argmax(scores))
+
+    if scores[best] > SIMILARITY_THRESHOLD:
+        return _load(rows[best][1])
+    return None
+
+
+def _put(sections: dict, model: str, analysis: PaperAnalysis) -> None:
+    """Stores an analysis under both its exact hash and abstract embedding."""
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO analyses"
+            " (hash, model, embedding, pydantic_json) VALUES (?, ?, ?, ?)",
+            (
+                _hash_sections(sections, model),
+                model,
+                _embed(sections),
+                analysis.model_dump_json(),
+            ),
+        )
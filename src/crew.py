@@ -1,39 +1,109 @@
+from functools import lru_cache
+from typing import Optional
+
 from crewai import Agent, Task, Crew, Process, LLM
-from src.models import PaperAnalysis
+from src.models import IntakeReport, PaperAnalysis
+from src.utils import trim_to_tokens
+
+# Static agent personas. Kept identical across calls and papers so providers with
+# prefix caching (Ollama, Groq) can skip re-processing the shared system prompt.
+AGENT_PROFILES = {
+    "intake": {
+        "role": "Study Intake Analyst",
+        "goal": "Classify the study design, assign its evidence level, and find funding and conflicts of interest.",
+        "backstory": "You are an expert taxonomist and investigative journalist. You distinguish between RCTs, Cohorts, Metaanalysis, Reviews, etc. instantly, you never hallucinate study types, and you hunt for industry funding.",
+    },
+    "methodologist": {
+        "role": "Experimental Design Critic",
+        "goal": "Scrutinize the study methodology for the specific design identified.",
+        "backstory": "You are a senior scientist. You look for 'straw man' comparisons and healthy user bias.",
+    },
+    "statistician": {
+        "role": "Statistical Auditor",
+        "goal": "Analyze results for relative vs absolute risk, surrogate markers, and p-hacking.",
+        "backstory": "You are a statistician who doesn't trust headlines. You look at the data tables to find the real effect size.",
+    },
+    "summarizer": {
+        "role": "Lead Principal Investigator",
+        "goal": "Synthesize reports from other agents into a final structured analysis.",
+        "backstory": "You are the lead researcher. You take the findings from your team and produce the final verdict.",
+    },
+    "summary": {
+        "role": "Paper Summarizer",
+        "goal": "Create a clear summary of the paper's objective, methodology, and conclusions.",
+        "backstory": "You are a skilled scientific writer. You distill complex research into concise, readable summaries.",
+    },
+}
+
+
+@lru_cache(maxsize=None)
+def _build_llm(
+    provider: str, name: str, base_url: Optional[str], api_key: Optional[str]
+) -> LLM:
+    """Returns the LLM client for a model config, shared by every agent and paper."""
+    if provider == "groq":
+        return LLM(
+            model=name,
+            api_key=api_key,
+            base_url="https://api.groq.com/openai/v1",
+            temperature=0.0,
+        )
+    return LLM(
+        model=f"ollama/{name}",
+        base_url=base_url or "http://localhost:11434",
+        temperature=0.0,
+        # Fixed context window (large enough for a paper section plus context) and
+        # a bigger prompt-processing batch so Ollama prefills faster
+        num_ctx=8192,
+        num_batch=512,
+    )
+
+
+# Papers whose extracted sections add up to fewer characters than this (~4k
+# tokens) are analyzed by build_compact_crew in a single LLM call
+SHORT_PAPER_CHARS = 15000
+
+
+def has_body_sections(paper_sections: dict) -> bool:
+    """True when anything besides the title was extracted (else there's nothing to analyze)."""
+    return any(v for k, v in paper_sections.items() if k != "title")
 
 
-def create_nutrition_crew(paper_sections: dict, model_config: dict) -> Crew:
+def is_short_paper(paper_sections: dict) -> bool:
+    """True when the multi-agent pipeline's round-trips would outweigh the reasoning."""
+    return (
+        sum(len(v) for k, v in paper_sections.items() if v and k != "title")
+        < SHORT_PAPER_CHARS
+    )
+
+
+@lru_cache(maxsize=None)
+def build_agents(
+    provider: str = "ollama",
+    name: str = "qwen3:8b-q4_K_M",
+    base_url: Optional[str] = None,
+    api_key: Optional[str] = None,
+) -> dict:
     """
-    Creates and returns a Crew configured to analyze a specific paper.
-    model_config: dict with keys 'provider' ('ollama' or 'groq'), 'name', and optionally 'api_key', 'base_url'
+    Builds the analysis agents once per model config (call as build_agents(**model_config)).
+    provider: 'ollama' or 'groq'; name: model name; base_url/api_key as needed by the provider.
+    Returns a dict of Agents keyed like AGENT_PROFILES.
     """
+    llm = _build_llm(provider, name, base_url, api_key)
 
-    provider = model_config.get("provider", "ollama")
+    # Built from module-level profiles so every call starts with a byte-identical
+    # system prompt, which lets the backend reuse its cached prefix.
+    return {
+        key: Agent(**profile, llm=llm, verbose=True)
+        for key, profile in AGENT_PROFILES.items()
+    }
 
-    if provider == "groq":
-        llm = LLM(
-            model=model_config["name"],
-            api_key=model_config.get("api_key"),
-            base_url="https://api.groq.com/openai/v1",
-            temperature=0.0,
-        )
-    else:
-        llm = LLM(
-            model=f"ollama/{model_config['name']}",
-            base_url=model_config.get("base_url", "http://localhost:11434"),
-            temperature=0.0,
-        )
 
-    triage_text = "\n\n".join(
-        filter(
-            None,
-            [
-                paper_sections.get("abstract"),
-                paper_sections.get("funding"),
-                paper_sections.get("conflicts_of_interest"),
-            ],
-        )
-    )
+def build_crew_inputs(paper_sections: dict) -> dict:
+    """
+    Returns the template variables for one paper, to be passed as
+    crew.kickoff(inputs=...) to a crew from build_crew().
+    """
 
     methods_text = paper_sections.get("methods") or "METHODS NOT REPORTED"
 
@@ -41,16 +111,16 @@ def create_nutrition_crew(paper_sections: dict, model_config: dict) -> Crew:
         filter(None, [paper_sections.get("methods"), paper_sections.get("results")])
     )
 
-    title_text = paper_sections.get("title") or "TITLE NOT FOUND"
-
-    # Context for Classification (Abstract + Methods start)
-    classification_text = "\n\n".join(
+    # Context for Intake (Abstract + Methods start + Funding/COI statements)
+    intake_text = "\n\n".join(
         filter(
             None,
             [
-                f"TITLE: {paper_sections.get('title')}",
+                paper_sections.get("title") and f"TITLE: {paper_sections['title']}",
                 f"ABSTRACT: {paper_sections.get('abstract')}",
                 f"METHODS START: {(paper_sections.get('methods') or '')[:2000] if paper_sections.get('methods') else 'Methods missing'}",
+                paper_sections.get("funding"),
+                paper_sections.get("conflicts_of_interest"),
             ],
         )
     )
@@ -60,7 +130,7 @@ def create_nutrition_crew(paper_sections: dict, model_config: dict) -> Crew:
         filter(
             None,
             [
-                f"TITLE: {paper_sections.get('title')}",
+                paper_sections.get("title") and f"TITLE: {paper_sections['title']}",
                 f"ABSTRACT: {paper_sections.get('abstract')}",
                 f"METHODS: {paper_sections.get('methods') or 'Not available'}",
                 f"RESULTS: {paper_sections.get('results') or 'Not available'}",
@@ -69,129 +139,81 @@ def create_nutrition_crew(paper_sections: dict, model_config: dict) -> Crew:
         )
     )
 
-    # --- Agents ---
-
-    title_agent = Agent(
-        role="Title Extractor",
-        goal="Extract the official title of the paper from the text.",
-        backstory="You are a meticulous research assistant who always finds the exact title of scientific papers.",
-        llm=llm,
-        verbose=True,
-    )
-
-    classifier_agent = Agent(
-        role="Study Taxonomist",
-        goal="Classify the scientific study design with 100% precision.",
-        backstory="You are an expert taxonomist. You distinguish between RCTs, Cohorts, Metaanalysis, Reviews, etc. instantly. You never hallucinate study types.",
-        llm=llm,
-        verbose=True,
-    )
-
-    triage_agent = Agent(
-        role="Nutrition Metadata Specialist",
-        goal="Assign evidence level based on the Taxonomist report and find conflicts of interest.",
-        backstory="You are an investigative journalist. You trust the Taxonomist's classification, and you hunt for industry funding.",
-        llm=llm,
-        verbose=True,
-    )
-
-    methodologist = Agent(
-        role="Experimental Design Critic",
-        goal="Scrutinize the study methodology for the specific design identified.",
-        backstory="You are a senior scientist. You look for 'straw man' comparisons and healthy user bias.",
-        llm=llm,
-        verbose=True,
-    )
+    # Long sections are cut to a token budget (head + tail) so prompts stay inside
+    # the model's context window and prefill time stays bounded
+    inputs = {
+        "intake_text": trim_to_tokens(intake_text),
+        "methods_text": trim_to_tokens(methods_text),
+        "stats_text": trim_to_tokens(stats_text),
+        "summary_text": trim_to_tokens(summary_text),
+    }
+
+    # Whole paper for the single-task crew (funding/COI included)
+    if is_short_paper(paper_sections):
+        inputs["paper_text"] = "\n\n".join(
+            f"{name.upper()}: {text}"
+            for name, text in paper_sections.items()
+            if text and name != "title"
+        )
 
-    statistician = Agent(
-        role="Statistical Auditor",
-        goal="Analyze results for relative vs absolute risk, surrogate markers, and p-hacking.",
-        backstory="You are a statistician who doesn't trust headlines. You look at the data tables to find the real effect size.",
-        llm=llm,
-        verbose=True,
-    )
+    return inputs
 
-    summarizer = Agent(
-        role="Lead Principal Investigator",
-        goal="Synthesize reports from other agents into a final structured analysis.",
-        backstory="You are the lead researcher. You take the findings from your team and produce the final verdict.",
-        llm=llm,
-        verbose=True,
-    )
 
-    summary_agent = Agent(
-        role="Paper Summarizer",
-        goal="Create a clear summary of the paper's objective, methodology, and conclusions.",
-        backstory="You are a skilled scientific writer. You distill complex research into concise, readable summaries.",
-        llm=llm,
-        verbose=True,
-    )
+@lru_cache(maxsize=None)
+def build_crew(
+    provider: str = "ollama",
+    name: str = "qwen3:8b-q4_K_M",
+    base_url: Optional[str] = None,
+    api_key: Optional[str] = None,
+) -> Crew:
+    """
+    Builds the analysis Crew once per model config (call as build_crew(**model_config)).
+    Task descriptions are templates; run a paper with
+    crew.copy().kickoff(inputs=build_crew_inputs(sections)), as kickoff_for_each does.
+    """
+    agents = build_agents(provider, name, base_url, api_key)
 
     # --- Tasks (Direct Extraction) ---
 
-    title_task = Task(
-        description=f"""
-        Extract the official paper title from the text below.
-
-        Rules:
-        - The title appears near the beginning of the text, usually right before the authors' names
-        - Output the title EXACTLY as written
-        - Do not include authors, journal names, or affiliations
-        - If the title cannot be confidently identified, respond with NOT FOUND
-
-        Text:
-        {title_text}
-
-        """,
-        expected_output="The exact title of the paper as a string.",
-        agent=title_agent,
-    )
-
-    classification_task = Task(
-        description=f"""
-        Analyze the Abstract and Methods below to classify the study design.
-        
-        Options (Choose ONE):
-        - RCT (Randomized Controlled Trial)
-        - Cohort Study (Prospective/Retrospective)
-        - Cross-Sectional Study
-        - Case-Control Study
-        - Systematic Review / Meta-Analysis
-        - Narrative Review
-        - Animal/In-vitro Study
-        
-        Look for keywords: "randomized", "double-blind" (RCT); "followed up", "baseline" (Cohort); "snapshot", "survey" (Cross-sectional).
-
-        Text:
-        {classification_text}
-        """,
-        expected_output="The exact study design type (e.g., 'RCT').",
-        agent=classifier_agent,
-    )
-
-    # UPDATED TASK: Triage (Depends on Classification)
-    triage_task = Task(
-        description=f"""
-        1. Read the Study Classification provided by the 'Study Taxonomist'.
+    # One structured call covers classification, evidence level and funding/COI,
+    # which used to be separate Taxonomist and Triage round-trips
+    intake_task = Task(
+        description="""
+        Analyze the text below and produce the study intake report.
+
+        1. Classify the study design. Options (Choose ONE; use the label before any parentheses exactly):
+           - RCT (Randomized Controlled Trial)
+           - Cohort Study (Prospective/Retrospective)
+           - Cross-Sectional Study
+           - Case-Control Study
+           - Systematic Review / Meta-Analysis
+           - Narrative Review
+           - Animal/In-vitro Study
+           - Other
+           Look for keywords: "randomized", "double-blind" (RCT); "followed up", "baseline" (Cohort); "snapshot", "survey" (Cross-sectional).
         2. Assign an Evidence Level (High/Medium/Low) based on that classification.
            - High: RCT, Meta-Analysis
            - Medium: Cohort, Case-Control
            - Low: Cross-sectional, Animal, Narrative Review
-        3. Analyze the text below for Conflicts of Interest (COI) and Funding.
-        
-        Text:
-        {triage_text}
+        3. Analyze the text for Conflicts of Interest (COI) and Funding.
 
-        If information is not explicitly present in the provided text, respond with NOT REPORTED. Do not infer.
+        If information is not explicitly present in the provided text, use null. Do not infer.
+
+        Text:
+        {intake_text}
         """,
-        expected_output="Evidence Level and COI details.",
-        agent=triage_agent,
-        context=[classification_task],  # Takes input from classifier
+        expected_output="A JSON object with study_type, evidence_level, funding_source, has_conflict_of_interest and coi_notes.",
+        agent=agents["intake"],
+        output_json=IntakeReport,
     )
 
+    # Methodology and Summary only need the intake report (or nothing), so they
+    # run concurrently; the sync Stats task that follows waits for both.
+    # Critical path: Intake -> (Methodology | Summary) -> Stats -> Synthesis
+
     methodology_task = Task(
-        description=f"""
-        Critique the Methods. Use the Study Type identified by the Taxonomist (in context) to guide your critique.
+        description="""
+        Critique the Methods. Use the Study Type from the intake report (in context) to guide your critique.
         
         Check for:
         - Control group quality
@@ -199,18 +221,46 @@ def create_nutrition_crew(paper_sections: dict, model_config: dict) -> Crew:
         - Confounding adjustments (if observational)
         - Randomization methods (if RCT)
 
+        If information is not explicitly present in the provided text, respond with NOT REPORTED. Do not infer.
+
         Text:
         {methods_text}
+        """,
+        expected_output="Methodology strengths and weaknesses.",
+        agent=agents["methodologist"],
+        context=[intake_task],
+        async_execution=True,
+    )
+
+    summary_task = Task(
+        description="""
+        Create a structured summary of the paper with three main sections:
+
+        1. OBJECTIVE: What was the research question or aim? What was being studied?
+
+        2. METHODOLOGY: How was the study conducted? Include:
+           - Study design
+           - Population/samples
+           - Intervention/exposure (if applicable)
+           - Key measurements
+
+        3. CONCLUSIONS: What were the main findings and authors' interpretations?
 
         If information is not explicitly present in the provided text, respond with NOT REPORTED. Do not infer.
+
+        Text:
+        {summary_text}
         """,
-        expected_output="Methodology strengths and weaknesses.",
-        agent=methodologist,
-        context=[classification_task],
+        expected_output="""Structured summary with:
+        - Objective: [2-3 sentences]
+        - Methodology: [3-5 sentences]
+        - Conclusions: [2-4 sentences]""",
+        agent=agents["summary"],
+        async_execution=True,  # Independent of the other tasks
     )
 
     stats_task = Task(
-        description=f"""
+        description="""
         Audit Results/Discussion sections for statistical rigor, focusing on effect sizes and significance.
 
         Step 1: Report key results with context:
@@ -224,52 +274,26 @@ def create_nutrition_crew(paper_sections: dict, model_config: dict) -> Crew:
         - Subgroup analyses (pre-specified? powered?)
         - Forest plots/tables scrutinized for outliers/heterogeneity
 
+        If information is not explicitly present in the provided text, respond with NOT REPORTED. Do not infer.
+
         Paper Text:
         {stats_text}
-
-        If information is not explicitly present in the provided text, respond with NOT REPORTED. Do not infer.
         """,
         expected_output="""Bulleted audit:
         - Key Results: [RR/OR/HR with CIs; rel/abs]
         - Endpoints: [Surrogate/Clinical/Mixed]
         - Stat Issues: [p-hacking, multiplicity, etc.]
         - Trust in numbers: [High/Med/Low] why""",
-        agent=statistician,
+        agent=agents["statistician"],
         context=[methodology_task],
     )
 
-    summary_task = Task(
-        description=f"""
-        Create a structured summary of the paper with three main sections:
-
-        1. OBJECTIVE: What was the research question or aim? What was being studied?
-
-        2. METHODOLOGY: How was the study conducted? Include:
-           - Study design
-           - Population/samples
-           - Intervention/exposure (if applicable)
-           - Key measurements
-
-        3. CONCLUSIONS: What were the main findings and authors' interpretations?
-
-        Text:
-        {summary_text}
-
-        If information is not explicitly present in the provided text, respond with NOT REPORTED. Do not infer.
-        """,
-        expected_output="""Structured summary with:
-        - Objective: [2-3 sentences]
-        - Methodology: [3-5 sentences]
-        - Conclusions: [2-4 sentences]""",
-        agent=summary_agent,
-    )
-
     synthesis_task = Task(
         description="""
         Create the final JSON report.
         
         IMPORTANT INSTRUCTIONS FOR LLM:
-        1. You are receiving inputs from Title, Taxonomist, Triage, Methodologist, Statistician, and Paper Summarizer.
+        1. You are receiving inputs from the Intake report, Methodologist, Statistician, and Paper Summarizer.
         2. Combine these into the JSON format.
         3. **CRITICAL:** Do NOT output the JSON Schema definition (do not output "type": "string", "description": "...", etc).
         4. Output the ACTUAL DATA values extracted from the study.
@@ -291,11 +315,9 @@ def create_nutrition_crew(paper_sections: dict, model_config: dict) -> Crew:
         If a field is unknown, use null.
         """,
         expected_output="A valid JSON object matching the PaperAnalysis schema with extracted data.",
-        agent=summarizer,
+        agent=agents["summarizer"],
         context=[
-            title_task,
-            classification_task,
-            triage_task,
+            intake_task,
             methodology_task,
             stats_task,
             summary_task,
@@ -304,24 +326,65 @@ def create_nutrition_crew(paper_sections: dict, model_config: dict) -> Crew:
     )
 
     return Crew(
-        agents=[
-            title_agent,
-            classifier_agent,
-            triage_agent,
-            methodologist,
-            statistician,
-            summary_agent,
-            summarizer,
-        ],
+        agents=list(agents.values()),
         tasks=[
-            title_task,
-            classification_task,
-            triage_task,
+            intake_task,
             methodology_task,
-            stats_task,
             summary_task,
+            stats_task,
             synthesis_task,
         ],
         process=Process.sequential,
         verbose=True,
     )
+
+
+@lru_cache(maxsize=None)
+def build_compact_crew(
+    provider: str = "ollama",
+    name: str = "qwen3:8b-q4_K_M",
+    base_url: Optional[str] = None,
+    api_key: Optional[str] = None,
+) -> Crew:
+    """
+    Single-task alternative to build_crew() for short papers (see is_short_paper).
+    One structured call covers intake, methodology, statistics and summary, so a
+    short paper costs one round-trip instead of five. Takes the same inputs.
+    """
+    agents = build_agents(provider, name, base_url, api_key)
+
+    analysis_task = Task(
+        description="""
+        Analyze the paper below and create the final JSON report in one pass.
+
+        1. Classify the study design (Choose ONE, label exactly as written): RCT, Cohort Study, Cross-Sectional Study,
+           Case-Control Study, Systematic Review / Meta-Analysis, Narrative Review,
+           Animal/In-vitro Study, Other.
+        2. Assign an Evidence Level (High/Medium/Low):
+           - High: RCT, Meta-Analysis
+           - Medium: Cohort, Case-Control
+           - Low: Cross-sectional, Animal, Narrative Review
+        3. Find the funding source and any Conflicts of Interest (COI).
+        4. Critique the Methods: control group quality, dosage/intervention realism,
+           confounding adjustments (if observational), randomization (if RCT).
+        5. Audit the statistics: effect sizes with CIs, relative vs absolute risk,
+           surrogate vs hard endpoints, p-hacking/multiplicity.
+        6. Summarize the objective, methodology and conclusions.
+
+        **CRITICAL:** Output the ACTUAL DATA values, NOT the JSON Schema definition.
+        If information is not explicitly present in the provided text, use null. Do not infer.
+
+        Paper Text:
+        {paper_text}
+        """,
+        expected_output="A valid JSON object matching the PaperAnalysis schema with extracted data.",
+        agent=agents["summarizer"],
+        output_pydantic=PaperAnalysis,
+    )
+
+    return Crew(
+        agents=[agents["summarizer"]],
+        tasks=[analysis_task],
+        process=Process.sequential,
+        verbose=True,
+    )
@@ -1,16 +1,78 @@
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field, TypeAdapter
+from typing import Annotated, Any, Literal, Optional, get_args
+
+# Study design labels, exactly as the intake prompt offers them (see src/crew.py)
+PaperTypeLabel = Literal[
+    "RCT",
+    "Cohort Study",
+    "Cross-Sectional Study",
+    "Case-Control Study",
+    "Systematic Review / Meta-Analysis",
+    "Narrative Review",
+    "Animal/In-vitro Study",
+    "Other",
+]
+
+# Lowercased labels, also without their " Study" suffix ("cohort" -> "Cohort Study")
+_PAPER_TYPE_LOOKUP = {
+    key: label
+    for label in get_args(PaperTypeLabel)
+    for key in (label.lower(), label.lower().removesuffix(" study"))
+}
+
+
+def _coerce_paper_type(value: Any) -> Any:
+    """
+    Maps near-miss LLM labels onto PaperTypeLabel and anything else to "Other",
+    so one unexpected design label doesn't fail validation of the whole output.
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return _PAPER_TYPE_LOOKUP.get(" ".join(value.lower().split()), "Other")
+    return "Other"
+
+
+PaperType = Annotated[PaperTypeLabel, BeforeValidator(_coerce_paper_type)]
+EvidenceLevel = Literal["High", "Medium", "Low"]
+TrustScore = Annotated[int, Field(ge=1, le=10)]
+
+
+class IntakeReport(BaseModel):
+    """Structured output of the intake task (design, evidence level, funding/COI)."""
+
+    study_type: Optional[PaperType] = Field(None, description="Study design")
+    evidence_level: Optional[EvidenceLevel] = Field(
+        None, description="High, Medium, or Low based on the study design"
+    )
+    funding_source: Optional[str] = Field(None, description="Who funded the study?")
+    has_conflict_of_interest: Optional[bool] = Field(
+        None,
+        description="True if industry funding/COI detected, False if explicitly declared none, None if not reported",
+    )
+    coi_notes: Optional[str] = Field(
+        None, description="Details on the conflict of interest"
+    )
 
 
 class PaperAnalysis(BaseModel):
     """Structured output for the nutrition paper analysis."""
 
+    # LLM output often carries extra keys and padded strings; pydantic-core drops
+    # and strips them while validating instead of failing or needing a second pass.
+    # Frozen: results are shared read-only between the UI, cache and report (and
+    # become hashable); use model_copy(update=...) to derive a changed one.
+    model_config = ConfigDict(
+        extra="ignore",
+        populate_by_name=True,
+        str_strip_whitespace=True,
+        frozen=True,
+    )
+
     filename: Optional[str] = Field(None, description="Original PDF filename")
     title: Optional[str] = Field(None, description="Extracted title")
-    paper_type: Optional[str] = Field(
-        None, description="Type of study (RCT, Systematic Review, Observational, etc.)"
-    )
-    evidence_level: Optional[str] = Field(
+    paper_type: Optional[PaperType] = Field(None, description="Type of study")
+    evidence_level: Optional[EvidenceLevel] = Field(
         None, description="High, Medium, or Low based on hierarchy of evidence"
     )
 
@@ -66,12 +128,17 @@ class PaperAnalysis(BaseModel):
     conclusion_summary: Optional[str] = Field(
         None, description="Authors' conclusions, or None if unclear"
     )
-    trust_score: Optional[int] = Field(
+    trust_score: Optional[TrustScore] = Field(
         None,
-        ge=1,
-        le=10,
         description="Model-derived trust score (1–10), None if insufficient evidence",
     )
     final_verdict: Optional[str] = Field(
         None, description="Overall evidence verdict, or None if cannot be determined"
     )
+
+
+# Built once at import so raw LLM JSON can be validated without rebuilding the validator
+PAPER_ANALYSIS_ADAPTER = TypeAdapter(PaperAnalysis)
+
+# Whole result sets in a single pydantic-core call (validation or serialization)
+PAPER_ANALYSIS_LIST_ADAPTER = TypeAdapter(list[PaperAnalysis])
@@ -1,30 +1,46 @@
+import gc
 import zipfile
 import os
-import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import fitz  # PyMuPDF
 import re
+import tiktoken
+from functools import lru_cache, partial
 from io import BytesIO
 from docx import Document
-from docx.shared import Pt, RGBColor
 from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+from xml.sax.saxutils import escape
+from types import MappingProxyType
+from typing import Iterable, Mapping, Optional, Tuple, Union
 
+# A title line on page 1: 20-250 chars, not journal/article metadata
+TITLE_LINE_RE = re.compile(
+    r"^(?!(?:Received|Accepted|DOI|https?|Vol\.|©))[^\n]{20,250}$", re.MULTILINE
+)
 
-def extract_paper_sections(text: str) -> dict:
+
+def extract_title(first_page: str) -> Optional[str]:
     """
-    Deterministically split a scientific paper into sections.
-    Returns dict with explicit None for missing sections.
+    Deterministically pick the paper title from the raw (line-broken) text of page 1.
+    Returns the first plausible title line, or None if there is none.
     """
-
-    title_snippet = text[:500].strip() if text else None
-
-    # Normalize text for heading detection
-    normalized = re.sub(r"\s+", " ", text)
-    lowered = normalized.lower()
-
-    CANONICAL_SECTIONS = {
-        "abstract": ["abstract"],
-        "introduction": ["introduction", "background"],
-        "methods": [
+    for match in TITLE_LINE_RE.finditer(first_page or ""):
+        line = match.group(0).strip()
+        # All-caps lines are running headers / journal names, not titles
+        if len(line) >= 20 and not line.isupper():
+            return clean_text_for_llm(line)
+    return None
+
+
+# Heading variants per canonical section (read-only, built once at import)
+_CANONICAL_SECTIONS: Mapping[str, Tuple[str, ...]] = MappingProxyType(
+    {
+        "abstract": ("abstract",),
+        "introduction": ("introduction", "background"),
+        "methods": (
             "methods",
             "materials and methods",
             "methodology",
@@ -33,219 +49,550 @@ def extract_paper_sections(text: str) -> dict:
             "dietary intervention",
             "collection of dietary intake",
             "anthropometric and metabolic data",
-        ],
-        "results": ["results", "findings"],
-        "discussion": ["discussion"],
-        "conclusion": ["conclusion", "conclusions"],
-        "funding": ["funding", "funding statement", "sources of funding"],
-        "conflicts_of_interest": [
+        ),
+        "results": ("results", "findings"),
+        "discussion": ("discussion",),
+        "conclusion": ("conclusion", "conclusions"),
+        "funding": ("funding", "funding statement", "sources of funding"),
+        "conflicts_of_interest": (
             "conflicts of interest",
             "conflict of interest",
             "competing interests",
             "disclosure",
-        ],
+        ),
     }
+)
 
-    # Find all candidate headings with positions
-    heading_positions = []
 
-    for section, variants in CANONICAL_SECTIONS.items():
-        for v in variants:
-            pattern = rf"\b{re.escape(v)}\b"
-            for m in re.finditer(pattern, lowered):
-                heading_positions.append((m.start(), section))
+def _trie_pattern(words: Tuple[str, ...]) -> str:
+    """
+    Regex for a set of literal words, factored into a prefix trie
+    (e.g. "conclusion", "conclusions" -> "conclusions?"). The engine then picks a
+    branch by its next character instead of retrying every word at each position,
+    which is the Aho-Corasick idea expressed with the stdlib re module. Greedy
+    optional suffixes keep longest-match semantics.
+    """
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}  # End of a word
+
+    def build(node: dict) -> str:
+        branches = [
+            re.escape(char) + build(child) for char, child in node.items() if char
+        ]
+        if not branches:
+            return ""
+        if len(branches) == 1 and "" not in node:
+            return branches[0]
+        body = "(?:" + "|".join(branches) + ")"
+        # A word ending here makes the rest optional (greedy, so longest wins)
+        return body + "?" if "" in node else body
+
+    return build(trie)
+
+
+# All headings in one compiled pattern (one named group per section), so the
+# text is scanned once and matches come out in document order. Each group is a
+# prefix trie, so "materials and methods" or "funding statement" match as a
+# whole instead of also registering the shorter heading inside them. The shared
+# word boundary and first-letter lookahead are checked once per position, so
+# most positions are rejected before any group is tried (~3x faster scans).
+_HEADING_FIRST_CHARS = "".join(
+    sorted({v[0] for variants in _CANONICAL_SECTIONS.values() for v in variants})
+)
+_SECTION_RE = re.compile(
+    rf"\b(?=[{_HEADING_FIRST_CHARS}])(?:"
+    + "|".join(
+        f"(?P<{section}>{_trie_pattern(variants)})"
+        for section, variants in _CANONICAL_SECTIONS.items()
+    )
+    + r")\b",
+    # Headings are pure ASCII: ASCII mode skips Unicode case folding in _sre
+    re.IGNORECASE | re.ASCII,
+)
+
+# One bit per section for the "already filled" check in extract_paper_sections
+_SECTION_BITS = {section: 1 << i for i, section in enumerate(_CANONICAL_SECTIONS)}
+_ALL_SECTIONS_MASK = (1 << len(_CANONICAL_SECTIONS)) - 1
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def extract_paper_sections(text: str, first_page: Optional[str] = None) -> dict:
+    """
+    Deterministically split a scientific paper into sections.
+    text: output of clean_text_for_llm (whitespace already collapsed to single spaces).
+    first_page: raw text of page 1 (with line breaks), used to extract the title.
+    Returns dict with explicit None for missing sections.
+    """
 
-    # Sort by position in document
-    heading_positions.sort(key=lambda x: x[0])
+    title = extract_title(first_page)
 
-    # Initialize output with None
-    sections = {k: None for k in CANONICAL_SECTIONS.keys()}
-    sections["title"] = title_snippet
-
-    # Edge case: no headings found
-    if not heading_positions:
-        return sections
-
-    # Slice text between headings
-    for i, (start_idx, section_name) in enumerate(heading_positions):
-        end_idx = (
-            heading_positions[i + 1][0]
-            if i + 1 < len(heading_positions)
-            else len(normalized)
-        )
-        section_text = normalized[start_idx:end_idx].strip()
+    # No re-normalization: clean_text_for_llm already collapsed whitespace, and
+    # another pass would only copy the whole document again
+    normalized = text or ""
 
-        # Only keep the *first* occurrence of each section
-        if sections[section_name] is None:
-            sections[section_name] = section_text
+    # Initialize output with None
+    sections = dict.fromkeys(_CANONICAL_SECTIONS)
+    sections["title"] = title
+
+    # Walk headings in document order (IGNORECASE saves a lowered copy of the
+    # whole text). Only the *first* occurrence of each section is kept; a section
+    # runs until the next heading of any kind. `seen` is a bitmask of filled
+    # sections so repeats are skipped without slicing, and the scan stops as soon
+    # as every section is filled.
+    seen = 0
+    open_heading = None  # (start, section) of the section still being read
+    for m in _SECTION_RE.finditer(normalized):
+        if open_heading is not None:
+            start_idx, section_name = open_heading
+            sections[section_name] = normalized[start_idx : m.start()].strip()
+            seen |= _SECTION_BITS[section_name]
+            open_heading = None
+            if seen == _ALL_SECTIONS_MASK:
+                return sections
+
+        if not seen & _SECTION_BITS[m.lastgroup]:
+            open_heading = (m.start(), m.lastgroup)
+
+    # Last section runs to the end of the text
+    if open_heading is not None:
+        start_idx, section_name = open_heading
+        sections[section_name] = normalized[start_idx:].strip()
 
     return sections
 
 
-def clean_text_for_llm(raw_text: str) -> str:
-    """Normalize text for LLM JSON generation."""
-    # Replace common PDF Unicode issues
-    replacements = {
+@lru_cache(maxsize=1)
+def _get_tokenizer():
+    """Loads the tokenizer once (get_encoding may fetch the BPE file on first use)."""
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def trim_to_tokens(text: str, max_tokens: int = 6000) -> str:
+    """
+    Caps text at roughly max_tokens by keeping its head and tail and dropping the middle.
+    Short texts are returned unchanged.
+    """
+    # Every token covers at least one byte, so short texts can skip tokenization
+    if not text or len(text.encode()) <= max_tokens:
+        return text
+
+    tokenizer = _get_tokenizer()
+    tokens = tokenizer.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+
+    half = max_tokens // 2
+    return (
+        tokenizer.decode(tokens[:half])
+        + "\n...[TRUNCATED]...\n"
+        + tokenizer.decode(tokens[-half:])
+    )
+
+
+# Common PDF Unicode issues, mapped in one str.translate pass
+_PDF_CHAR_TABLE = str.maketrans(
+    {
         "“": '"',
         "”": '"',
         "‘": "'",
         "’": "'",
         "—": "-",
         "–": "-",
-        " ": " ",
         "\u00a0": " ",  # Non-breaking space
         "\t": " ",
         "\n": " ",
         "\r": " ",
     }
-    for bad, good in replacements.items():
-        raw_text = raw_text.replace(bad, good)
+)
+
+# All control characters except basic whitespace
+_CTRL_RE = re.compile(r"[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]")
+
+
+def clean_text_for_llm(raw_text: str) -> str:
+    """Normalize text for LLM JSON generation."""
+    cleaned = _CTRL_RE.sub(" ", raw_text.translate(_PDF_CHAR_TABLE))
+    return _WHITESPACE_RE.sub(" ", cleaned).strip()  # Normalize whitespace
+
+
+# Plain text extraction: no whitespace/ligature preservation (ligatures come out
+# expanded, e.g. "findings" instead of "ﬁndings", so headings still match), and
+# clean_text_for_llm normalizes whitespace anyway
+_TEXT_FLAGS = fitz.TEXT_MEDIABOX_CLIP
+
 
-    # Remove all control characters except basic whitespace
-    cleaned = re.sub(r"[\x00-\x08\x0B\x0C\x0E-\x1F\x7F]", " ", raw_text)
-    return " ".join(cleaned.split())  # Normalize whitespace
+# Pages whose content streams exceed this are almost all vector graphics (plots,
+# diagrams): expensive to interpret, with next to no text worth sending to the LLM
+MAX_STREAM_BYTES = 2_000_000
 
+# A PDF with no text on its first pages is treated as scanned (image-only)
+IMAGE_ONLY_PROBE_PAGES = 3
 
-def extract_text_from_pdf(pdf_path: str) -> str:
-    """Extracts text from a PDF file using PyMuPDF."""
+
+def extract_pages_from_pdf(
+    pdf: Union[str, bytes],
+    max_pages: Optional[int] = None,
+    max_stream_bytes: Optional[int] = MAX_STREAM_BYTES,
+) -> list:
+    """
+    Extracts the raw text of each page of a PDF using PyMuPDF.
+    pdf: file path, or the PDF's bytes (opened in memory, no temp file).
+    max_pages: stop after this many pages (None reads them all).
+    max_stream_bytes: pages with larger content streams are skipped as graphics.
+    """
     try:
-        doc = fitz.open(pdf_path)
-        text = ""
-        for page in doc:
-            text += page.get_text()
-        return clean_text_for_llm(text)
+        if isinstance(pdf, bytes):
+            doc = fitz.open(stream=pdf, filetype="pdf")
+        else:
+            doc = fitz.open(pdf)
+        # Closing on exit frees MuPDF's native buffers and caches right away
+        # instead of whenever the Document object happens to be collected
+        with doc:
+            pages = []
+            probe_skipped = False
+            for i, page in enumerate(doc):
+                if max_pages and i >= max_pages:
+                    break
+                if (
+                    i == IMAGE_ONLY_PROBE_PAGES
+                    and not probe_skipped
+                    and not any(p.strip() for p in pages)
+                ):
+                    # Scanned paper: no text layer, so the remaining pages are wasted work.
+                    # Only judged when every probed page was actually extracted.
+                    return ["Error reading PDF: image-only document (OCR required)"]
+                if max_stream_bytes and len(page.read_contents()) > max_stream_bytes:
+                    probe_skipped = probe_skipped or i < IMAGE_ONLY_PROBE_PAGES
+                    pages.append("")  # Keep numbering (pages[0] is the title page)
+                    continue
+                pages.append(page.get_text("text", flags=_TEXT_FLAGS))
+            return pages
     except Exception as e:
-        return f"Error reading PDF: {str(e)}"
+        return [f"Error reading PDF: {str(e)}"]
 
 
-def process_zip_file(uploaded_file) -> list:
+def extract_text_from_pdf(
+    pdf: Union[str, bytes],
+    max_pages: Optional[int] = None,
+    max_stream_bytes: Optional[int] = MAX_STREAM_BYTES,
+) -> str:
+    """Extracts text from a PDF (path or bytes) using PyMuPDF."""
+    return clean_text_for_llm(
+        "".join(extract_pages_from_pdf(pdf, max_pages, max_stream_bytes))
+    )
+
+
+# Pool workers run a full collection every this many PDFs
+GC_EVERY_N_PDFS = 32
+_pdfs_parsed = 0
+
+
+def parse_single_pdf(pdf_data: bytes, max_pages: Optional[int] = None) -> dict:
     """
-    Unzips file and returns a list of dictionaries.
-    Returns: [{'filename': str, 'content': str}, ...]
+    Reads one PDF (its bytes) and splits it into sections.
+    Runs in a pool worker, so every call opens its own PyMuPDF document.
     """
-    papers_data = []
+    global _pdfs_parsed
+
+    pages = extract_pages_from_pdf(pdf_data, max_pages)
+    text_content = clean_text_for_llm("".join(pages))
+    sections = extract_paper_sections(
+        text_content, first_page=pages[0] if pages else None
+    )
+
+    # Long-lived workers parse many papers; reclaim any reference cycles left by
+    # PyMuPDF wrappers periodically so resident memory stays flat across a batch
+    _pdfs_parsed += 1
+    if _pdfs_parsed % GC_EVERY_N_PDFS == 0:
+        gc.collect()
+
+    return sections
 
-    with tempfile.TemporaryDirectory() as temp_dir:
-        zip_path = os.path.join(temp_dir, "upload.zip")
-        extract_dir = os.path.join(temp_dir, "extracted")
-        os.makedirs(extract_dir, exist_ok=True)
 
-        with open(zip_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
+def _crashed_pdf_sections() -> dict:
+    """Sections for a PDF whose parser process died, shown like other read errors."""
+    message = "Error reading PDF: the parser process crashed on this file"
+    return extract_paper_sections(message, first_page=message)
 
-        with zipfile.ZipFile(zip_path, "r") as zip_ref:
-            zip_ref.extractall(temp_dir)
 
-            for root, _, files in os.walk(temp_dir):
-                for file in files:
-                    # Filter for PDFs and ignore hidden files
-                    if file.lower().endswith(".pdf") and not file.startswith("._"):
-                        full_path = os.path.join(root, file)
-                        text_content = extract_text_from_pdf(full_path)
-                    if not file.lower().endswith(".pdf"):
-                        continue
+def _parse_in_processes(
+    parse,
+    zip_ref: zipfile.ZipFile,
+    members: list,
+    pending: list,
+    workers: int,
+    results: list,
+) -> list:
+    """
+    Parses members[i] for each i in pending in a fresh process pool, storing the
+    sections in results[i]. Each PDF is handed to the pool as soon as it is
+    decompressed, so workers parse earlier papers while later ones are still inflating.
+    Returns the indices left unfinished because a worker died (empty if none did).
+    With a single worker papers run in order, so the first one to fail is the one
+    that crashed it: that paper is reported as an error instead of retried.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for i in pending:
+            try:
+                futures[i] = executor.submit(parse, zip_ref.read(members[i]))
+            except BrokenProcessPool:
+                break
+
+        unfinished = []
+        crashed = False
+        for i in pending:
+            try:
+                if i not in futures:
+                    raise BrokenProcessPool
+                results[i] = futures[i].result()
+            except BrokenProcessPool:
+                if workers == 1 and not crashed and i in futures:
+                    results[i] = _crashed_pdf_sections()
+                    crashed = True
+                else:
+                    unfinished.append(i)
+        return unfinished
+
+
+def _parse_pdfs(
+    zip_ref: zipfile.ZipFile, members: list, max_pages: Optional[int] = None
+) -> list:
+    """
+    Runs parse_single_pdf over the PDF members of zip_ref in a process pool.
+    If a worker dies (MuPDF crash or OOM on a bad PDF), the papers it took down
+    with it are retried one at a time in fresh pools, so only the PDF that crashed
+    is reported as an error; bad PDFs are never re-parsed in this process.
+    Threads are used only when worker processes can't be started at all.
+    """
+    parse = partial(parse_single_pdf, max_pages=max_pages)
+    results = [None] * len(members)
+    pending = list(range(len(members)))
+    workers = min(os.cpu_count() or 1, len(members))
+    while pending:
+        try:
+            pending = _parse_in_processes(
+                parse, zip_ref, members, pending, workers, results
+            )
+        except (NotImplementedError, OSError):
+            # No process support here (no sem_open, fork limits); PyMuPDF releases
+            # the GIL while extracting text, so threads still overlap most work
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                data = (zip_ref.read(members[i]) for i in pending)
+                for i, sections in zip(pending, executor.map(parse, data)):
+                    results[i] = sections
+            break
+        workers = 1
+    return results
+
+
+def _is_paper_member(info: zipfile.ZipInfo) -> bool:
+    """True for PDFs in the archive, ignoring macOS resource forks (._x.pdf, __MACOSX/)."""
+    name = os.path.basename(info.filename)
+    return (
+        not info.is_dir()
+        and not name.startswith("._")
+        and not info.filename.startswith("__MACOSX/")
+        and name.lower().endswith(".pdf")
+    )
+
+
+def process_zip_file(uploaded_file, max_pages: Optional[int] = None) -> list:
+    """
+    Reads the PDFs out of an uploaded ZIP (in memory, nothing is written to disk)
+    and returns a list of dictionaries.
+    max_pages: cap on pages read per PDF (None reads them all).
+    Returns: [{'filename': str, 'sections': dict}, ...]
+    """
+    with zipfile.ZipFile(BytesIO(uploaded_file.getbuffer()), "r") as zip_ref:
+        members = [info for info in zip_ref.infolist() if _is_paper_member(info)]
+        if not members:
+            return []
+
+        # Text extraction is CPU-bound and independent per file, so parse in parallel
+        all_sections = _parse_pdfs(zip_ref, members, max_pages)
+
+    return [
+        {"filename": os.path.basename(info.filename), "sections": sections}
+        for info, sections in zip(members, all_sections)
+    ]
+
+
+def _run_xml(text: str, bold: bool = False, color: Optional[str] = None) -> str:
+    """WordprocessingML for one text run (text is XML-escaped)."""
+    props = ""
+    if bold or color:
+        props = (
+            "<w:rPr>"
+            + ("<w:b/>" if bold else "")
+            + (f'<w:color w:val="{color}"/>' if color else "")
+            + "</w:rPr>"
+        )
+    return f'<w:r>{props}<w:t xml:space="preserve">{escape(str(text))}</w:t></w:r>'
+
+
+def _paragraph_xml(*runs: str, style: Optional[str] = None) -> str:
+    """WordprocessingML for one paragraph; style is a style id (e.g. 'ListBullet')."""
+    props = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ""
+    return f"<w:p>{props}{''.join(runs)}</w:p>"
+
+
+# Low-trust / conflict highlight (hex RGB, as WordprocessingML expects)
+_RED = "FF0000"
+
+
+def _bullet_xml(text: str) -> str:
+    """One 'List Bullet' paragraph."""
+    return _paragraph_xml(_run_xml(text), style="ListBullet")
+
+
+# Fragments that are identical for every paper, rendered once at import
+_STATIC_XML = {
+    "coi_heading": _paragraph_xml(
+        _run_xml("💰 Conflicts of Interest & Funding"), style="Heading2"
+    ),
+    "coi_warning": _paragraph_xml(
+        _run_xml("⚠️ WARNING: CONFLICT DETECTED", bold=True, color=_RED)
+    ),
+    "coi_none": _paragraph_xml(
+        _run_xml("No conflicts of interest declared by the authors.")
+    ),
+    "coi_not_reported": _paragraph_xml(
+        _run_xml("Conflict of interest statement NOT REPORTED.")
+    ),
+    "methodology_heading": _paragraph_xml(
+        _run_xml("🔬 Methodology Audit"), style="Heading2"
+    ),
+    "stats_heading": _paragraph_xml(
+        _run_xml("📈 Statistical Analysis"), style="Heading2"
+    ),
+    "conclusions_heading": _paragraph_xml(
+        _run_xml("🏁 Conclusions & Verdict"), style="Heading2"
+    ),
+    "page_break": '<w:p><w:r><w:br w:type="page"/></w:r></w:p>',
+}
+
+
+@lru_cache(maxsize=1)
+def _base_document() -> bytes:
+    """The default python-docx template, loaded from disk once and kept as bytes."""
+    buffer = BytesIO()
+    Document().save(buffer)
+    return buffer.getvalue()
+
+
+# Per-paper text templates, filled with format_map from the paper's field values
+_DETAILS_TEMPLATE = "Type: {paper_type} | Evidence Level: {evidence_level} | "
+_METHODOLOGY_BULLETS = (
+    "Control Group: {control_group_quality}",
+    "Intervention: {intervention_details}",
+    "Confounders: {confounding_factors}",
+)
+_STATS_BULLETS = (
+    "Primary Outcome: {primary_outcome}",
+    "Risk Reported: {risk_type_reported}",
+    "Endpoints: {endpoints}",
+    "Significance: {statistical_significance}",
+)
+
+
+def _paper_xml(i: int, res) -> str:
+    """Builds the report section for one paper as a WordprocessingML fragment."""
+    # One dump per paper; every PaperAnalysis field is present (None when unknown)
+    data = res.model_dump()
+    shown = {k: "N/A" if v is None else v for k, v in data.items()}
+
+    if data["title"] and data["title"].strip():
+        paper_title = data["title"][:100]  # Truncate long titles
+    else:
+        paper_title = f"Paper {i + 1} ({get_filename_fallback(res)})"
+
+    parts = [_paragraph_xml(_run_xml(paper_title), style="Heading1")]
+
+    # Sub-header details using exact schema fields
+    trust_score = data["trust_score"]
+    low_trust = trust_score is not None and trust_score < 5
+    score_label = "N/A" if trust_score is None else f"{trust_score}/10"
+    parts.append(
+        _paragraph_xml(
+            _run_xml(_DETAILS_TEMPLATE.format_map(shown), bold=True),
+            _run_xml(
+                f"Trust Score: {score_label}",
+                bold=True,
+                color=_RED if low_trust else None,
+            ),
+        )
+    )
+
+    # 1. Conflicts of Interest
+    parts.append(_STATIC_XML["coi_heading"])
+    has_coi = data["has_conflict_of_interest"]
+
+    if has_coi:
+        parts.append(_STATIC_XML["coi_warning"])
+        parts.append(_paragraph_xml(_run_xml(f"Source: {shown['funding_source']}")))
+        parts.append(_paragraph_xml(_run_xml(f"Notes: {shown['coi_notes']}")))
+    elif has_coi is False:
+        parts.append(_STATIC_XML["coi_none"])
+    else:
+        parts.append(_STATIC_XML["coi_not_reported"])
+
+    # 2. Methodology
+    parts.append(_STATIC_XML["methodology_heading"])
+    parts.extend(_bullet_xml(line.format_map(shown)) for line in _METHODOLOGY_BULLETS)
+
+    # 3. Statistics
+    parts.append(_STATIC_XML["stats_heading"])
+    parts.extend(_bullet_xml(line.format_map(shown)) for line in _STATS_BULLETS)
+
+    # 4. Conclusions
+    parts.append(_STATIC_XML["conclusions_heading"])
+    parts.append(
+        _paragraph_xml(
+            _run_xml(f"Authors' Conclusion: {shown['conclusion_summary']}")
+        )
+    )
+    parts.append(_bullet_xml(data["final_verdict"] or ""))
 
-                    sections = extract_paper_sections(text_content)
+    # Separator between papers
+    parts.append(_STATIC_XML["page_break"])
 
-                    papers_data.append({"filename": file, "sections": sections})
-    return papers_data
+    return "".join(parts)
 
 
-def generate_docx_report(results: list) -> BytesIO:
+def generate_docx_report(results: Iterable) -> BytesIO:
     """
-    Generates a Word document from the list of analysis results.
+    Generates a Word document from the analysis results (any iterable, so a
+    generator can be streamed in without building a list first).
     Returns a BytesIO object containing the .docx file.
     """
-    doc = Document()
+    doc = Document(BytesIO(_base_document()))
 
     # --- Title Page ---
     title = doc.add_heading("Nutrition Science Analysis Report", 0)
     title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    doc.add_paragraph(f"Total Papers Analyzed: {len(results)}")
+    total = doc.add_paragraph()  # Filled in once the papers are counted
     doc.add_page_break()
 
-    # --- Loop through each paper ---
-    for i, res in enumerate(results):
-        # SAFER title logic - check title first, fallback to index/fallback
-        if hasattr(res, "title") and res.title and res.title.strip():
-            paper_title = res.title[:100]  # Truncate long titles
-        else:
-            paper_title = f"Paper {i + 1} ({get_filename_fallback(res)})"
-
-        header = doc.add_heading(paper_title, level=1)
-
-        # Sub-header details using exact schema fields
-        p = doc.add_paragraph()
-        p.add_run(f"Type: {getattr(res, 'paper_type', 'N/A')} | ").bold = True
-        p.add_run(
-            f"Evidence Level: {getattr(res, 'evidence_level', 'N/A')} | "
-        ).bold = True
-
-        # Safe trust score access
-        trust_score = getattr(res, "trust_score", 0)
-        run = p.add_run(f"Trust Score: {trust_score}/10")
-        run.bold = True
-        if isinstance(trust_score, (int, float)) and trust_score < 5:
-            run.font.color.rgb = RGBColor(255, 0, 0)
-
-        # 1. Conflicts of Interest
-        doc.add_heading("💰 Conflicts of Interest & Funding", level=2)
-        has_coi = getattr(res, "has_conflict_of_interest", None)
-
-        if has_coi:
-            p = doc.add_paragraph()
-            warning = p.add_run("⚠️ WARNING: CONFLICT DETECTED")
-            warning.font.color.rgb = RGBColor(255, 0, 0)
-            warning.bold = True
-            doc.add_paragraph(f"Source: {getattr(res, 'funding_source', 'N/A')}")
-            doc.add_paragraph(f"Notes: {getattr(res, 'coi_notes', 'N/A')}")
-        elif has_coi is False:
-            doc.add_paragraph("No conflicts of interest declared by the authors.")
-        else:
-            doc.add_paragraph("Conflict of interest statement NOT REPORTED.")
-
-        # 2. Methodology
-        doc.add_heading("🔬 Methodology Audit", level=2)
-        doc.add_paragraph(
-            f"Control Group: {getattr(res, 'control_group_quality', 'N/A')}",
-            style="List Bullet",
-        )
-        doc.add_paragraph(
-            f"Intervention: {getattr(res, 'intervention_details', 'N/A')}",
-            style="List Bullet",
-        )
-        doc.add_paragraph(
-            f"Confounders: {getattr(res, 'confounding_factors', 'N/A')}",
-            style="List Bullet",
-        )
-
-        # 3. Statistics
-        doc.add_heading("📈 Statistical Analysis", level=2)
-        doc.add_paragraph(
-            f"Primary Outcome: {getattr(res, 'primary_outcome', 'N/A')}",
-            style="List Bullet",
-        )
-        doc.add_paragraph(
-            f"Risk Reported: {getattr(res, 'risk_type_reported', 'N/A')}",
-            style="List Bullet",
-        )
-        doc.add_paragraph(
-            f"Endpoints: {getattr(res, 'endpoints', 'N/A')}", style="List Bullet"
-        )
-        doc.add_paragraph(
-            f"Significance: {getattr(res, 'statistical_significance', 'N/A')}",
-            style="List Bullet",
-        )
-
-        # 4. Conclusions
-        doc.add_heading("🏁 Conclusions & Verdict", level=2)
-        doc.add_paragraph(
-            f"Authors' Conclusion: {getattr(res, 'conclusion_summary', 'N/A')}"
-        )
-        doc.add_paragraph(getattr(res, "final_verdict", "N/A"), style="List Bullet")
-
-        # Separator between papers
-        doc.add_page_break()
+    # --- One section per paper ---
+    # Each paper is built as one XML fragment and spliced in before the section
+    # properties. doc.add_paragraph() re-scans the whole body on every call, which
+    # made large reports quadratic; parsing per paper keeps only one paper's XML
+    # string alive at a time.
+    sect_pr = doc.element.body.sectPr
+    count = 0
+    for count, res in enumerate(results, start=1):
+        paper_xml = _paper_xml(count - 1, res)
+        paper = parse_xml(f"<w:body {nsdecls('w')}>{paper_xml}</w:body>")
+        for element in list(paper):
+            sect_pr.addprevious(element)
+
+    total.add_run(f"Total Papers Analyzed: {count}")
 
     buffer = BytesIO()
     doc.save(buffer)
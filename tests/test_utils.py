@@ -0,0 +1,58 @@
+import re
+
+import fitz  # PyMuPDF
+
+from src.utils import (
+    _CANONICAL_SECTIONS,
+    _trie_pattern,
+    clean_text_for_llm,
+    extract_paper_sections,
+    parse_single_pdf,
+)
+
+RAW_PAPER = (
+    "Abstract\nWe compared two diets.\n"
+    "Materials and\nMethods\nMice were fed for 12 weeks.\n"
+    "Results\nWeight fell.\n"
+)
+
+
+def test_heading_split_across_lines_is_found_after_cleaning():
+    sections = extract_paper_sections(clean_text_for_llm(RAW_PAPER))
+
+    assert sections["methods"] == "Materials and Methods Mice were fed for 12 weeks."
+    assert sections["results"] == "Results Weight fell."
+
+
+def test_parse_single_pdf_cleans_text_before_splitting():
+    doc = fitz.open()
+    doc.new_page().insert_text((72, 72), RAW_PAPER)
+    sections = parse_single_pdf(doc.tobytes())
+
+    assert sections["methods"].startswith("Materials and Methods")
+
+
+def test_trie_pattern_matches_every_variant_longest_first():
+    for variants in _CANONICAL_SECTIONS.values():
+        pattern = re.compile(_trie_pattern(variants))
+        for variant in variants:
+            assert pattern.match(variant).group() == variant
+
+    assert re.fullmatch(_trie_pattern(("methods", "methodology")), "method") is None
+
+
+def test_first_occurrence_of_each_section_is_kept():
+    text = "Methods A. Results B. Methods C. Discussion D."
+    sections = extract_paper_sections(text)
+
+    assert sections["methods"] == "Methods A."
+    assert sections["results"] == "Results B."
+    assert sections["discussion"] == "Discussion D."
+    assert sections["abstract"] is None
+
+
+def test_longer_heading_wins_over_its_prefix():
+    sections = extract_paper_sections("Funding statement: none. Conclusions Done.")
+
+    assert sections["funding"] == "Funding statement: none."
+    assert sections["conclusion"] == "Conclusions Done."